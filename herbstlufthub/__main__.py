@@ -24,17 +24,25 @@ specified by options or arguments to their subcommand (eg, "pullpub").
 import os
 import sys
 import zmq
+import json
+import re
 import time
 import click
-import select
+import shlex
 import subprocess
+from functools import lru_cache
 from collections import defaultdict
 
 from string import Formatter
-from urllib.parse import urlparse, ParseResult, parse_qs
+from urllib.parse import unquote_plus
 
 workdir = os.getenv("HOME","/tmp")
 
+# Where to cache things that are slow to determine.
+cachedir = os.path.join(os.getenv("XDG_CACHE_HOME",
+                                  os.path.join(workdir, ".cache")),
+                        "herbstlufthub")
+
 # The "hub" addresses are where the pub/sub network forms.
 # Here gives the defaults.
 default_hub_links = (
@@ -47,30 +55,52 @@ default_push_links = (
     f'ipc://{workdir}/hpush.ipc',
 )
 
-# SUBs need topic to subscribe.  One may filter but by default they
-# take messages from all topics.
+# SUBs need topic to subscribe.  Consumers subscribe to just the
+# topics they use so libzmq filters the rest.  Those that want
+# everything take all topics.
 all_topics = ("",)
 
+# Options applied to every socket.  LINGER bounds how long exit waits
+# to deliver unsent messages (eg from onepush) instead of forever.
+# HWMs are raised above libzmq's 1000 to absorb event bursts.
+default_sockopts = {
+    zmq.LINGER: 1000,
+    zmq.SNDHWM: 65536,
+    zmq.RCVHWM: 65536,
+}
+
+# Options additionally applied before linking to a tcp:// address so
+# dead peers are noticed.
+tcp_sockopts = {
+    zmq.TCP_KEEPALIVE: 1,
+    zmq.TCP_KEEPALIVE_IDLE: 60,
+    zmq.TCP_KEEPALIVE_INTVL: 10,
+}
+
+# An address with optional query: scheme://rest?query
+url_re = re.compile(r'^(?P<scheme>[^:/?]+)://(?P<rest>[^?]*)(?:\?(?P<query>.*))?$')
+
+@lru_cache(maxsize=64)
 def parse_url(url):
     '''
     Return (url, query) with query as dict and stripped from URL
     '''
-    p = urlparse(url)
-    q = parse_qs(p.query)
-    if p.netloc:                # tcp
-        d = p._asdict()
-        d.pop("query")
-        url = ParseResult(query='', **d).geturl()
-    else:                       # ipc, inproc
-        # geturl() doesn't preserve '//' if no netloc
-        url = '%s://%s' % (p.scheme, p.path)
-
-    return (url, q)
+    m = url_re.match(url)
+    if not m:
+        raise ValueError(f'malformed URL: {url}')
+    q = dict()
+    for kv in (m["query"] or "").split('&'):
+        key, _, val = kv.partition('=')
+        if not val:             # as parse_qs, drop blank values
+            continue
+        q.setdefault(unquote_plus(key), []).append(unquote_plus(val))
+    return ('%s://%s' % (m["scheme"], m["rest"]), q)
 
 class Port:
     '''
     Add functionality to a socket.
     '''
+    __slots__ = ("name", "sock")
 
     def __init__(self, name, sock):
         self.name = name
@@ -81,14 +111,16 @@ class Port:
         Link port to a URL endpoint.  
 
         If no link=(bind|connect) in URL query params use deflink.
+        Any topic=<prefix> URL query params are subscribed.
         '''
         addr, query = parse_url(url)
 
-        topics = query.get("topics", [])
-        for topic in topics:
+        for topic in query.get("topic", []):
             self.subscribe(topic)
-        if not topics:
-            self.subscribe()
+
+        if addr.startswith("tcp://"):
+            for opt, val in tcp_sockopts.items():
+                self.sock.setsockopt(opt, val)
 
         links = query.get("link", [deflink])
         sys.stderr.write(f'\tport {self.name}, addr {addr}, links {links}\n')
@@ -106,14 +138,13 @@ class Port:
 class Node:
     '''
     Collect some sockets as named ports on a node
+
+    Each port is also available as a plain attribute of its name.
     '''
 
     def __init__(self):
-        self.zctx = zmq.Context()
+        self.zctx = zmq.Context.instance() # one per process
         self.ports = dict();
-        
-    def __getattr__(self, name):
-        return self.ports[name]
 
     def port(self, name, ztype):
         '''
@@ -123,24 +154,51 @@ class Node:
             return self.ports[name]
         except KeyError:
             pass
-        port = Port(name, self.zctx.socket(ztype))
+        if hasattr(self, name):
+            raise ValueError(f'port name {name} clashes with node attribute')
+        sock = self.zctx.socket(ztype)
+        for opt, val in default_sockopts.items():
+            sock.setsockopt(opt, val)
+        port = Port(name, sock)
         self.ports[name] = port
+        setattr(self, name, port)
         return port
         
 
-def node_with_port(ztype, links=(), portname='link', deflink='connect'):
+def node_with_port(ztype, links=(), portname='link', deflink='connect',
+                   sockopts=None):
     '''
     Return a node primied with one linked up port
+
+    Any sockopts dict of zmq option to value is applied before linking
+    and after default_sockopts.
     '''
     links = links or default_hub_links
     sys.stderr.write(f'node_with_port: name:{portname} ztype:{ztype} links:{links}\n')
     node = Node()
     port = node.port(portname, ztype)
+    for opt, val in (sockopts or {}).items():
+        port.sock.setsockopt(opt, val)
     for link in links:
         sys.stderr.write(f'\tlink:{link}\n')
         port.link(link, deflink)
     return node
 
+def drain(sock, copy=True):
+    '''
+    Return list of all messages waiting on socket.
+
+    This blocks for the first message and then collects any others
+    already queued without blocking.
+    '''
+    msgs = [sock.recv(copy=copy)]
+    try:
+        while True:
+            msgs.append(sock.recv(zmq.NOBLOCK, copy=copy))
+    except zmq.Again:
+        pass
+    return msgs
+
 
 @click.group()
 @click.option("-l","--link", multiple=True,
@@ -164,36 +222,68 @@ def hcpub(ctx, command):
     A PUB providing events from a herbstclient.
     '''
     node = node_with_port(zmq.PUB, ctx.obj['links'], deflink='bind')
-    proc = subprocess.Popen(command,
-                            shell=True,
-                            universal_newlines=True,
-                            text=True, bufsize=1,
+    proc = subprocess.Popen(shlex.split(command),
+                            bufsize=0,
                             stdout=subprocess.PIPE,
                             stderr=subprocess.PIPE)
+    sock = node.link.sock
+    # Lines are sent from views into one reused buffer.  The send must
+    # copy as libzmq may not hold on to the buffer.
+    chunk = bytearray(65536)
+    view = memoryview(chunk)
+    tail = bytearray()          # partial line carried to next read
     while True:
-        line = proc.stdout.readline()
-        sys.stderr.write(line)
-        line = line.strip()
-        node.link.sock.send_string(line)
+        nread = proc.stdout.readinto(chunk)
+        if not nread:           # command exited
+            break
+        sys.stderr.buffer.write(view[:nread])
+        sys.stderr.buffer.flush()
+        start = 0
+        while True:
+            end = chunk.find(b'\n', start, nread)
+            if end < 0:
+                break
+            if tail:
+                tail += view[start:end]
+                line = tail
+            else:
+                line = view[start:end]
+            if line and (line[0] <= 32 or line[-1] <= 32):
+                line = bytes(line).strip()
+            sock.send(line)
+            tail.clear()
+            start = end + 1
+        tail += view[start:nread]
+    if tail:                    # last line lacked a newline
+        sock.send(bytes(tail).strip())
 
 
 @cli.command("stdpub")
+@click.option("-q", "--quiet", is_flag=True, default=False,
+              help="Do not echo events to stdout")
 @click.pass_context
-def stdpub(ctx):
+def stdpub(ctx, quiet):
     '''
     A PUB that reads events as lines on stdin.
     '''
     node = node_with_port(zmq.PUB, ctx.obj['links'])
-    for line in sys.stdin:
+    sock = node.link.sock
+    write = sys.stdout.buffer.write
+    flush = sys.stdout.buffer.flush
+    for line in sys.stdin.buffer:
         line = line.strip()
-        click.echo(line)
-        node.link.sock.send_string(line)
+        if not quiet:
+            write(line + b'\n')
+            flush()
+        sock.send(line, copy=False)
 
 
 @cli.command("pullpub")
+@click.option("-q", "--quiet", is_flag=True, default=False,
+              help="Do not echo events to stdout")
 @click.argument("inputs", nargs=-1)
 @click.pass_context
-def pullpub(ctx, inputs):
+def pullpub(ctx, quiet, inputs):
     '''
     A PUB that receives events on a PULL.
     '''
@@ -205,10 +295,20 @@ def pullpub(ctx, inputs):
     pull = inbox.sock
     pub = node.link.sock    
 
+    if quiet:
+        while True:
+            for msg in drain(pull, copy=False):
+                pub.send(msg, copy=False)
+
+    out = sys.stdout.buffer
     while True:
-        line = pull.recv_string()
-        click.echo(line)
-        pub.send_string(line)
+        batch = bytearray()
+        for msg in drain(pull, copy=False):
+            batch += msg.buffer
+            batch += b'\n'
+            pub.send(msg, copy=False)
+        out.write(batch)
+        out.flush()
 
 
 @cli.command("onepush")
@@ -226,31 +326,70 @@ def onepush(ctx, timeout, event):
         raise RuntimeError("onepush: no event given")
     msg = '\t'.join(event)
     links = ctx.obj.get('links', ()) or default_push_links
-    node = node_with_port(zmq.PUSH, links, deflink='connect')
-    node.link.sock.SNDTIMEO = timeout
+    node = node_with_port(zmq.PUSH, links, deflink='connect',
+                          sockopts={zmq.SNDTIMEO: timeout})
     try:
         node.link.sock.send_string(msg)
     except zmq.error.Again:
         sys.stderr.write(f'push not sent due to timeout {timeout} ms\n')
 
 
+def wait_subscriber(sock, msg, timeout):
+    '''
+    Wait on an XPUB for a subscription matching msg.
+
+    Return True if one arrives before timeout in milliseconds.
+    '''
+    deadline = time.monotonic() + timeout/1000.0
+    while True:
+        remain = max(0.0, deadline - time.monotonic())
+        if not sock.poll(remain*1000.0):
+            return False
+        sub = sock.recv()
+        if sub[:1] == b'\x01' and msg.startswith(sub[1:]):
+            return True
+
+
 @cli.command("onepub")
+@click.option("-t","--timeout", default=100,
+              help="Time in milliseconds to wait for a subscriber")
+@click.option("--legacy", is_flag=True, default=False,
+              help="Use a PUB and a fixed sleep instead of waiting for a subscriber")
 @click.argument("event", nargs=-1)
 @click.pass_context
-def onepub(ctx, event):
+def onepub(ctx, timeout, legacy, event):
     '''Send a single event command from a PUB.
 
-    This only makes to use with a connect.  A sleep is required for
-    slow subscriber syndrome.
+    This only makes to use with a connect.  To avoid slow subscriber
+    syndrome each link gets its own XPUB which waits until a matching
+    subscription arrives from its peer and only then sends.  The
+    timeout is shared by all links and need only cover the connection
+    handshake.  If no subscriber on a link wants the event then none
+    arrives and the event is not sent there.  The --legacy sleep is
+    for subscribers which can not be detected this way.
 
     '''
     if not event:
         raise RuntimeError("onepub: no event given")
-    msg = '\t'.join(event)
-
-    node = node_with_port(zmq.PUB, ctx.obj['links'])
-    time.sleep(0.1)             # help slow subscriber syndrome
-    node.link.sock.send_string(msg)
+    msg = '\t'.join(event).encode()
+
+    if legacy:
+        node = node_with_port(zmq.PUB, ctx.obj['links'])
+        time.sleep(0.1)             # help slow subscriber syndrome
+        node.link.sock.send(msg)
+        return
+
+    # One XPUB per link as subscriptions do not say which peer sent them.
+    links = ctx.obj['links'] or default_hub_links
+    nodes = [node_with_port(zmq.XPUB, (link,), sockopts={zmq.XPUB_VERBOSE: 1})
+             for link in links]
+    deadline = time.monotonic() + timeout/1000.0
+    for link, node in zip(links, nodes):
+        remain = max(0.0, deadline - time.monotonic())*1000.0
+        if wait_subscriber(node.link.sock, msg, remain):
+            node.link.sock.send(msg)
+        else:
+            sys.stderr.write(f'no subscriber for event on {link} after {timeout} ms\n')
 
 
 @cli.command("stdsub")
@@ -258,62 +397,172 @@ def onepub(ctx, event):
 def stdsub(ctx):
     '''
     Receive event messages from a SUB and write them to stdout.
+
+    All topics are taken unless a link URL gives topic=<prefix>.
     '''
-    node = node_with_port(zmq.SUB, ctx.obj['links'])
+    links = ctx.obj['links'] or default_hub_links
+    node = node_with_port(zmq.SUB, links)
+    if not any(parse_url(link)[1].get("topic") for link in links):
+        for topic in all_topics:
+            node.link.subscribe(topic)
+    sock = node.link.sock
+    out = sys.stdout.buffer
     while True:
         # sys.stderr.write("receiving:\n")
-        line = node.link.sock.recv_string()
-        sys.stdout.write(line + '\n')
+        batch = bytearray()
+        for msg in drain(sock, copy=False):
+            batch += msg.buffer
+            batch += b'\n'
+        out.write(batch)
+        out.flush()
     
+formatter = Formatter()
+
+@lru_cache(maxsize=32)
+def parse_pattern(pattern):
+    '''
+    Return tuple of (literal, key, spec, conversion) parsed from pattern.
+    '''
+    return tuple(formatter.parse(pattern))
+
 class SimpleTransform:
     def __init__(self, pattern):
         self.pattern = pattern
         data = dict()
-        for one in Formatter().parse(pattern):
-            key = one[1]
+        # The pattern as (literal, key) pairs in the order given.
+        self.segments = list()
+        # Map etype to (arg index, key) pairs it provides.
+        positions = defaultdict(list)
+        # Only fields w/out format spec or conversion may be joined.
+        self.plain = True
+        for literal, key, spec, conv in parse_pattern(pattern):
+            self.segments.append((literal, key))
             if key is None:
                 continue
+            if spec or conv:
+                self.plain = False
+            if key in data:
+                continue
             data[key] = ''
+            etype, _, ind = key.rpartition('_')
+            if ind.isdigit():
+                positions[etype].append((int(ind), key))
         self.data = data
+        self.positions = dict(positions)
+        self.line = None
+
+    def topics(self):
+        '''
+        Return the event type prefixes used by the pattern.
+        '''
+        return tuple(self.positions)
+
+    def render(self):
+        '''
+        Return pattern applied to current data.
+        '''
+        if self.plain:
+            data = self.data
+            line = ''.join(lit if key is None else lit + data[key]
+                           for lit, key in self.segments)
+        else:
+            line = self.pattern.format(**self.data)
+        if not line.endswith('\n'):
+            line += '\n'
+        return line
 
     def __call__(self, *args):
-        etype = args[0]
+        positions = self.positions.get(args[0])
+        if positions is None:
+            return
 
-        gotone = False
-        for ind, part in enumerate(args):
-            key = f'{etype}_{ind}'
-            if key in self.data:
-                gotone = True
-                self.data[key] = part
+        gotone = changed = False
+        for ind, key in positions:
+            if ind >= len(args):
+                continue
+            gotone = True
+            if self.data[key] != args[ind]:
+                self.data[key] = args[ind]
+                changed = True
         if not gotone:
             return
 
-        line = self.pattern.format(**self.data)
-        if not line.endswith('\n'):
-            line += '\n'
-        return line
+        # Unchanged data returns the very same line object.
+        if changed or self.line is None:
+            self.line = self.render()
+        return self.line
 
 def transform_pipe(sock, transform, command):
+    '''
+    Apply transform to events from sock and pipe new lines to command.
+
+    A single zmq.Poller waits on the socket and both ends of the
+    child's pipes.  Queued events are drained and folded into one
+    line per wakeup and a line equal to the last one is not resent.
+    '''
     shell = False
     if isinstance(command, str):
         shell = True
     proc = subprocess.Popen(command,
                             shell=shell,
-                            universal_newlines=True,
-                            text=True, bufsize=1,
+                            bufsize=0,
                             stdin=subprocess.PIPE,
                             stdout=subprocess.PIPE,
                             stderr=subprocess.DEVNULL)
 
-    poller = select.poll()
-    poller.register(proc.stdout, select.POLLIN)
-    #poller.register(proc.stderr, select.POLLIN)
+    # Writes to the child never block.  While it is slow, only the
+    # newest line is kept, after finishing any line already started.
+    infd = proc.stdin.fileno()
+    os.set_blocking(infd, False)
+    partial = b''               # unwritten tail of a started line
+    queued = None               # newest line not yet started
+
+    def flush():
+        nonlocal partial, queued
+        while partial or queued:
+            if not partial:
+                partial, queued = queued, None
+            try:
+                nwrote = os.write(infd, partial)
+            except BlockingIOError:
+                return True
+            partial = partial[nwrote:]
+        return False
+
+    # One zmq.Poller (zmq_poll, ie poll(2)) watches the SUB and the
+    # child's pipes so no side blocks another.
+    outfd = proc.stdout.fileno()
+    outbuf = bytearray(65536)
+    poller = zmq.Poller()
+    poller.register(sock, zmq.POLLIN)
+    poller.register(outfd, zmq.POLLIN)
 
     last_line = None
     while True:
-        event = sock.recv_string()
-        sys.stderr.write(f'event: {event}\n')
-        line = transform(*event.split('\t'))
+        events = dict(poller.poll())
+
+        if events.get(outfd):
+            nread = proc.stdout.readinto(outbuf)
+            if nread:
+                sys.stderr.buffer.write(b'got back: ' + outbuf[:nread] + b'\n')
+                sys.stderr.buffer.flush()
+            else:               # child closed its stdout
+                poller.unregister(outfd)
+
+        if events.get(infd) and not flush():
+            poller.unregister(infd)
+
+        if not events.get(sock):
+            continue
+
+        # Fold all pending events, only the final line matters.
+        line = None
+        for event in drain(sock):
+            event = event.decode()
+            sys.stderr.write(f'event: {event}\n')
+            got = transform(*event.split('\t'))
+            if got is not None:
+                line = got
         if line is None:
             #sys.stderr.write(f'unused: {event}\n')
             continue
@@ -321,23 +570,24 @@ def transform_pipe(sock, transform, command):
             #sys.stderr.write(f'unchanged: {event}\n')
             continue
         last_line = line
-        sys.stderr.write(line)
-        proc.stdin.write(line)
-
-        got = poller.poll(0.1)
-        if not got:
-            continue
-        out = proc.stdout.readline()
-        sys.stderr.write(f'got back: {out}\n')
-
+        if isinstance(line, str):
+            line = line.encode()
+        sys.stderr.buffer.write(line)
+        sys.stderr.buffer.flush()
+        blocked = partial or queued
+        queued = line
+        if not blocked and flush():
+            poller.register(infd, zmq.POLLOUT)
 
 @cli.command("subpipe")
 @click.option("-p", "--pattern",
               default='',
               help="String format for input to panel command")
 @click.argument("command", nargs=-1)
+@click.option("--conflate", is_flag=True, default=False,
+              help="Keep only the most recent event while busy")
 @click.pass_context
-def subpipe(ctx, pattern, command):
+def subpipe(ctx, pattern, command, conflate):
     '''Transform events from SUB via pattern to command stdin.
 
     Events are collected into a dictionary keyed by event type.  When
@@ -349,56 +599,94 @@ def subpipe(ctx, pattern, command):
 
       hh subpipe -p "focus:{focus_changed_1} title:{window_title_changed_1}" cat 
 
+    With --conflate, libzmq keeps only the latest event of any type
+    while the command is slow.  Events of other types that arrive in
+    the meantime are lost, so use it only when every subscribed event
+    carries the full state of interest.
+
     '''
 
-    node = node_with_port(zmq.SUB, ctx.obj['links'])
-    transform_pipe(node.link.sock, SimpleTransform(pattern), command)
+    transform = SimpleTransform(pattern)
+    sockopts = {zmq.CONFLATE: 1} if conflate else None
+    node = node_with_port(zmq.SUB, ctx.obj['links'], sockopts=sockopts)
+    for topic in transform.topics():
+        node.link.subscribe(topic)
+    transform_pipe(node.link.sock, transform, command)
 
 
-def hc(*args):
+def hc(*args, check=False):
     cmd = ["herbstclient"]+[str(a) for a in args]
     out = subprocess.run(cmd, capture_output=True)
+    if check and out.returncode != 0:
+        err = out.stderr.decode().strip()
+        raise RuntimeError(f'{" ".join(cmd)} failed ({out.returncode}): {err}')
     return out.stdout.decode().strip()
 
+@lru_cache(maxsize=None)
+def hc_once(*args):
+    '''
+    Like hc() but run only once per process for the given args.
+
+    Use for settings which are not expected to change in a session.
+    A failed query raises RuntimeError so it is never remembered.
+    '''
+    return hc(*args, check=True)
+
+# dzen2 format for each tag status character.  A "%s" is filled with
+# the active window border color.
+dzen_status_fmt = {
+    '#': b"^bg(%s)^fg(#101010)",
+    '+': b"^bg(#9CA668)^fg(#141414)",
+    ':': b"^bg()^fg(#ffffff)",
+    '!': b"^bg(#FF0675)^fg(#141414)",
+}
+dzen_status_default = b"^bg()^fg(#ababab)"
+dzen_click_fmt = b'^ca(1,herbstclient focus_monitor "0" && herbstclient use "%d") %s ^ca()'
+
 class DzenTransform:
 
-    tag_names="ABCDEFHIJKLMNOPQRSTUVWXYZ"
+    tag_names=b"ABCDEFHIJKLMNOPQRSTUVWXYZ"
 
     def __init__(self):
         self.data = defaultdict(str)
+        # The border color is fixed for the session, tag status only
+        # changes with a "tag_*" event.
+        selbg = hc_once("get","window_border_active_color").encode()
+        self.status_fmt = {c: f % selbg if b'%' in f else f
+                           for c, f in dzen_status_fmt.items()}
+        self.separator = b'^bg()^fg(%s)|' % selbg
+        self.tag_status = list()
+        self.tags_line = b''
+        self.refresh_tags()
+
+    def topics(self):
+        '''
+        Return the event type prefixes which cause an update.
+        '''
+        return ("window_title_changed", "focus_changed", "tag_")
 
-    def fmt_tags(self):
-
-        selbg=hc("get","window_border_active_color")
-        selfg='#101010'
-        separator=f'^bg()^fg({selbg})|'
+    def refresh_tags(self):
+        '''
+        Query herbstclient for current (status, name) of each tag.
+        '''
+        self.tag_status = [(ts[0], ts[1:]) for ts in
+                           (ts.strip() for ts in hc("tag_status","0").split('\t'))
+                           if ts]
+        self.tags_line = self.fmt_tags()
 
-        tag_status = [ts.strip() for ts in 
-                      hc("tag_status","0").split('\t') if ts.strip()]
+    def fmt_tags(self):
         chunks = list()
-        for ind,ts in enumerate(tag_status):
-            status, name = ts
-            alias = self.tag_names[ind]
-            try:
-                sfmt = {
-                    '#': f"^bg({selbg})^fg({selfg})",
-                    '+':  "^bg(#9CA668)^fg(#141414)",
-                    ':':  "^bg()^fg(#ffffff)",
-                    '!':  "^bg(#FF0675)^fg(#141414)"
-                }[status]
-            except KeyError:
-                sfmt = "^bg()^fg(#ababab)"
-            cfmt = f'^ca(1,herbstclient focus_monitor "0" && herbstclient use "{ind+1}") {alias} ^ca()'
-
-            chunks.append(sfmt + cfmt)
-        chunks.append(separator)
-        return "".join(chunks)
+        for ind,(status, name) in enumerate(self.tag_status):
+            chunks.append(self.status_fmt.get(status, dzen_status_default))
+            chunks.append(dzen_click_fmt % (ind+1, self.tag_names[ind:ind+1]))
+        chunks.append(self.separator)
+        return b"".join(chunks)
 
     def fmt_data(self):
-        return "^bg()^fg() {title}".format(**self.data)
+        return b"^bg()^fg() " + self.data["title"].encode()
     
     def fmt(self):
-        return self.fmt_tags() + self.fmt_data()
+        return self.tags_line + self.fmt_data()
 
     def __call__(self, *args):
         etype = args[0]
@@ -407,31 +695,97 @@ class DzenTransform:
                 return
             self.data["window"] = args[1]
             self.data["title"] = args[2]
+        elif etype.startswith("tag_"):
+            self.refresh_tags()
 
-        return self.fmt() + '\n'
+        return self.fmt() + b'\n'
 
-@cli.command("subdzen")
-@click.pass_context
-def subdzen(ctx):
-    '''Connect a SUB to dzen2'''
-    sx, sy, sw, sh = hc("monitor_rect", 0).split()
+def hlwm_stamp():
+    '''
+    Return dict which changes when display or hlwm config changes.
+    '''
+    confdir = os.getenv("XDG_CONFIG_HOME", os.path.join(workdir, ".config"))
+    autostart = os.path.join(confdir, "herbstluftwm", "autostart")
+    try:
+        mtime = os.stat(autostart).st_mtime
+    except OSError:
+        mtime = None
+    return dict(display=os.getenv("DISPLAY", ""), mtime=mtime)
+
+def cached_command(name, make, refresh=False):
+    '''
+    Return command argv list as cached under name.
+
+    The make() function is called to produce the argv if the cache is
+    missing, stale w.r.t. hlwm_stamp() or refresh is True.  If make()
+    raises, nothing is cached.  Without an hlwm autostart file there is
+    nothing to tell when the cache is stale so none is used.
+    '''
+    stamp = hlwm_stamp()
+    if stamp["mtime"] is None:
+        return make()
+
+    path = os.path.join(cachedir, f'{name}-argv.json')
+    if not refresh:
+        try:
+            with open(path) as fp:
+                got = json.load(fp)
+            if got["stamp"] == stamp:
+                return got["argv"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    argv = make()
+    try:
+        os.makedirs(cachedir, exist_ok=True)
+        with open(path, "w") as fp:
+            json.dump(dict(stamp=stamp, argv=argv), fp)
+    except OSError as err:
+        sys.stderr.write(f'failed to cache {name} command: {err}\n')
+    return argv
+
+def dzen_command():
+    '''
+    Return dzen2 argv list fit to the first monitor.
+    '''
+    sx, sy, sw, sh = hc_once("monitor_rect", 0).split()
     px, py, pw, ph = sx, sy, sw, "32"
 
     font="-*-fixed-medium-*-*-*-24-*-*-*-*-*-*-*"
     buttons="button3=;button4=exec:'herbstclient use_index -1';button5=exec:'herbstclient use_index +1'"
     bgcolor=""
     fgcolor='#efefef'
-    bgcolor=hc("get","frame_border_normal_color")
+    bgcolor=hc_once("get","frame_border_normal_color")
 
-    command=["dzen2",
-             "-x", px, "-y", py, "-w", pw, "-h", ph,
-             "-fn", font,
-             "-e", buttons,
-             "-ta","l", "-bg", bgcolor, "-fg", fgcolor]
+    return ["dzen2",
+            "-x", px, "-y", py, "-w", pw, "-h", ph,
+            "-fn", font,
+            "-e", buttons,
+            "-ta","l", "-bg", bgcolor, "-fg", fgcolor]
 
+@cli.command("subdzen")
+@click.option("--conflate", is_flag=True, default=False,
+              help="Keep only the most recent event while busy")
+@click.option("--refresh", is_flag=True, default=False,
+              help="Recalculate the cached dzen2 command line")
+@click.pass_context
+def subdzen(ctx, conflate, refresh):
+    '''Connect a SUB to dzen2
 
-    node = node_with_port(zmq.SUB, ctx.obj['links'])
-    transform_pipe(node.link.sock, DzenTransform(), command)
+    The dzen2 command line is cached until the display or the
+    herbstluftwm autostart file changes.  Use --refresh after other
+    changes such as to the monitor layout.
+
+    See subpipe for caveats of --conflate.
+    '''
+    command = cached_command("subdzen", dzen_command, refresh)
+
+    transform = DzenTransform()
+    sockopts = {zmq.CONFLATE: 1} if conflate else None
+    node = node_with_port(zmq.SUB, ctx.obj['links'], sockopts=sockopts)
+    for topic in transform.topics():
+        node.link.subscribe(topic)
+    transform_pipe(node.link.sock, transform, command)
     
 
 